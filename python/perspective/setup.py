@@ -5,45 +5,145 @@
 # This file is part of the Perspective library, distributed under the terms of
 # the Apache License 2.0.  The full license can be found in the LICENSE file.
 #
-from __future__ import print_function
-
+import functools
+import hashlib
 import io
+import itertools
 import os
 import os.path
 import platform
 import re
+import shutil
 import subprocess
 import sys
-from codecs import open
-from distutils.version import LooseVersion
+from shutil import which
 
 from setuptools import Extension, find_packages, setup
 from setuptools.command.build_ext import build_ext
 from setuptools.command.sdist import sdist
 
-try:
-    from shutil import which
 
-    CPU_COUNT = os.cpu_count()
-except ImportError:
-    # Python2
+def get_cpu_count():
+    """Get the default number of parallel compile jobs to run, which is the
+    number of CPUs this process may run on, capped so that each job has 2GB of
+    RAM.
+    """
+    try:
+        # respects cgroup/taskset limits, unlike `cpu_count()`
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+
     try:
-        from backports.shutil_which import which
-    except ImportError:
-        # just rely on path
-        def which(x):
-            return x
+        memory = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        count = min(count, max(1, memory // (2 * 1024 ** 3)))
+    except (AttributeError, ValueError, OSError):
+        pass
+
+    return count
+
 
-    import multiprocessing
+CPU_COUNT = get_cpu_count()
+
+
+def get_num_jobs():
+    """Get the number of parallel compile jobs to run, from `PSP_NUM_JOBS` if
+    set, otherwise 2 in Docker and `CPU_COUNT` elsewhere.
+    """
+    jobs = os.environ.get("PSP_NUM_JOBS")
+
+    if not jobs:
+        return 2 if os.environ.get("DOCKER", "") else CPU_COUNT
+
+    try:
+        jobs = int(jobs)
+    except ValueError:
+        jobs = 0
+
+    if jobs < 1:
+        raise RuntimeError(
+            "PSP_NUM_JOBS must be a positive integer, got {!r}".format(
+                os.environ["PSP_NUM_JOBS"]
+            )
+        )
+
+    return jobs
+
+
+_CMAKE_VERSION_RE = re.compile(r"version\s*([\d.]+)")
+
+# cmake is trusted not to leak inherited descriptors, so skip closing them all
+# on POSIX, where it is a loop up to `RLIMIT_NOFILE` per process spawned.
+_CLOSE_FDS = platform.system() == "Windows"
+
+# Environment variables read by `cpp/perspective/CMakeLists.txt` at configure
+# time, which must invalidate the configure cache key just like its arguments.
+_CONFIGURE_ENV = (
+    "PSP_DEBUG",
+    "PSP_MANYLINUX",
+    "BOOST_ROOT",
+    "BOOST_INCLUDEDIR",
+    "BOOST_LIBRARYDIR",
+)
+
+_SOURCE_SUFFIXES = (".cpp", ".h", ".cmake", ".in", "CMakeLists.txt")
+
+# The libraries built from the `psp` and `binding` targets
+if platform.system() == "Windows":
+    _LIBRARIES = ("libpsp.dll", "libbinding.pyd")
+else:
+    _LIBRARIES = ("libpsp.so", "libbinding.so")
+
+
+def _read_key(path):
+    """Read the key stored at `path`, or `None` if it doesn't exist."""
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _walk_mtimes(path, suffixes):
+    """Yield the modification times of all files under `path` whose names end
+    with one of `suffixes`.
+    """
+    try:
+        entries = os.scandir(path)
+    except OSError:
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_mtimes(entry.path, suffixes)
+            elif entry.name.endswith(suffixes):
+                yield entry.stat().st_mtime
+
+
+@functools.lru_cache(maxsize=4)
+def _cmake_version(cmake):
+    """Get the version of the `cmake` executable as a tuple of ints, cached
+    so repeated `build_ext` runs in one process don't re-launch it.
+    """
+    out = subprocess.run(
+        [cmake, "--version"],
+        check=True,
+        stdout=subprocess.PIPE,
+        close_fds=_CLOSE_FDS,
+    ).stdout
+    return tuple(
+        int(x) for x in _CMAKE_VERSION_RE.search(out.decode()).group(1).split(".")
+    )
 
-    CPU_COUNT = multiprocessing.cpu_count()
 
 here = os.path.abspath(os.path.dirname(__file__))
 
-with open(os.path.join(here, "README.md"), encoding="utf-8") as f:
-    long_description = f.read().replace("\r\n", "\n")
+# universal newlines mode normalizes line endings while reading
+with io.open(os.path.join(here, "README.md"), encoding="utf-8") as f:
+    long_description = f.read()
 
-requires = [
+_CORE_REQUIRES = (
     "ipywidgets>=7.5.1",
     "future>=0.16.0",
     "numpy>=1.13.1",
@@ -52,20 +152,15 @@ requires = [
     "six>=1.11.0",
     "tornado>=4.5.3",
     "traitlets>=4.3.2",
-]
-
-if sys.version_info.major < 3:
-    requires += ["backports.shutil-which"]
-
-if (sys.version_info.major == 2 and sys.version_info.minor < 7) or (
-    sys.version_info.major == 3 and sys.version_info.minor < 6
-):
-    raise Exception("Requires Python 2.7/3.6 or later")
+)
 
-requires_dev_py2 = [
+requires_dev = [
+    "black==20.8b1",
     "Faker>=1.0.0",
     "flake8>=3.7.8",
+    "flake8-black>=0.2.0",
     "mock",
+    "ninja",
     "pybind11>=2.4.0",
     "pyarrow>=0.16.0",
     "pytest>=4.3.0",
@@ -76,12 +171,7 @@ requires_dev_py2 = [
     "Sphinx>=1.8.4",
     "sphinx-markdown-builder>=0.5.2",
     "wheel",
-] + requires
-
-requires_dev = [
-    "flake8-black>=0.2.0",
-    "black==20.8b1",
-] + requires_dev_py2  # for development, remember to install black and flake8-black
+] + list(_CORE_REQUIRES)
 
 
 def get_version(file, name="__version__"):
@@ -97,6 +187,11 @@ def get_version(file, name="__version__"):
 
 version = get_version(os.path.join(here, "perspective", "core", "_version.py"))
 
+# Only walk `perspective/`, rather than every directory next to setup.py
+packages = ["perspective"] + [
+    "perspective." + p for p in find_packages(where=os.path.join(here, "perspective"))
+]
+
 
 class PSPExtension(Extension):
     def __init__(self, name, sourcedir="dist"):
@@ -111,123 +206,297 @@ class PSPBuild(build_ext):
     def run_cmake(self):
         self.cmake_cmd = which("cmake")
         try:
-            out = subprocess.check_output([self.cmake_cmd, "--version"])
+            self.cmake_version = _cmake_version(self.cmake_cmd)
         except OSError:
             raise RuntimeError(
                 "CMake must be installed to build the following extensions: "
                 + ", ".join(e.name for e in self.extensions)
             )
 
-        if platform.system() == "Windows":
-            cmake_version = LooseVersion(
-                re.search(r"version\s*([\d.]+)", out.decode()).group(1)
+        # CMake can't switch the generator of an existing build directory, so
+        # keep the cached one unless another is requested via `PSP_GENERATOR`,
+        # in which case the stale cache is discarded.
+        cached_generator = self.cached_generator()
+        self.generator = os.environ.get("PSP_GENERATOR") or cached_generator
+
+        if cached_generator and self.generator != cached_generator:
+            os.remove(os.path.join(self.build_temp, "CMakeCache.txt"))
+            shutil.rmtree(
+                os.path.join(self.build_temp, "CMakeFiles"), ignore_errors=True
             )
-            if cmake_version < "3.1.0":
-                raise RuntimeError("CMake >= 3.1.0 is required on Windows")
+
+        # Otherwise prefer Ninja when it is available; on Windows it can only
+        # drive MSVC from a Developer Command Prompt. The generator is always
+        # resolved to a concrete name, so that the `-G` passed to the first
+        # configure matches the cached one on later runs.
+        if self.generator is None:
+            if which("ninja") is not None and (
+                platform.system() != "Windows" or "VCINSTALLDIR" in os.environ
+            ):
+                self.generator = "Ninja"
+            elif platform.system() == "Windows":
+                import distutils.msvccompiler as dm
+
+                self.generator = {
+                    "12": "Visual Studio 12 2013",
+                    "14": "Visual Studio 14 2015",
+                    "14.1": "Visual Studio 15 2017",
+                }.get(dm.get_build_version(), "Visual Studio 15 2017")
+            else:
+                self.generator = os.environ.get("CMAKE_GENERATOR", "Unix Makefiles")
+
+        # Distribute compilation across `DISTCC_HOSTS` with distcc
+        self.distcc = None
+        if os.environ.get("PSP_DISTCC"):
+            self.distcc = which("distcc")
+            if self.distcc is None:
+                raise RuntimeError("distcc must be installed when PSP_DISTCC is set")
+
+        # Cache compiled objects across rebuilds with sccache or ccache
+        self.compiler_launcher = None
+        if not os.environ.get("PSP_DISABLE_CCACHE"):
+            if self.distcc:
+                # only ccache can hand off cache misses to distcc
+                self.compiler_launcher = which("ccache")
+            else:
+                self.compiler_launcher = which("sccache") or which("ccache")
+
+        if self.distcc and not self.compiler_launcher:
+            self.compiler_launcher = self.distcc
+
+        # `cmake --build --parallel` was added in 3.12
+        if self.cmake_version < (3, 12):
+            raise RuntimeError("CMake >= 3.12 is required")
+
+        # Shared by all extensions
+        env = dict(os.environ, PSP_ENABLE_PYTHON="1", OSX_DEPLOYMENT_TARGET="10.9")
+
+        if self.compiler_launcher:
+            # Don't let `__DATE__`/`__TIME__` and PCH defines defeat the cache
+            env.setdefault("CCACHE_SLOPPINESS", "time_macros,pch_defines")
+
+            if self.distcc and self.compiler_launcher != self.distcc:
+                env["CCACHE_PREFIX"] = "distcc"
+
+            if platform.system() == "Windows":
+                env.setdefault(
+                    "SCCACHE_DIR",
+                    os.path.abspath(os.path.join(self.build_temp, "sccache")),
+                )
 
         for ext in self.extensions:
-            self.build_extension_cmake(ext)
+            self.build_extension_cmake(ext, env)
 
-    def build_extension_cmake(self, ext):
+    def build_extension_cmake(self, ext, env):
         extdir = os.path.abspath(os.path.dirname(self.get_ext_fullpath(ext.name)))
         cfg = "Debug" if self.debug else "Release"
 
         PYTHON_VERSION = "{}.{}".format(sys.version_info.major, sys.version_info.minor)
 
+        # CMake expects forward slashes, even on Windows
+        src = ext.sourcedir.replace("\\", "/")
+        prefix = sys.prefix.replace("\\", "/")
+        exe = sys.executable.replace("\\", "/")
+        outdir = os.path.abspath(os.path.join(extdir, "perspective", "table")).replace(
+            "\\", "/"
+        )
+
         cmake_args = [
-            "-DCMAKE_LIBRARY_OUTPUT_DIRECTORY="
-            + os.path.abspath(os.path.join(extdir, "perspective", "table")).replace(
-                "\\", "/"
-            ),
+            "-DCMAKE_LIBRARY_OUTPUT_DIRECTORY={}".format(outdir),
             "-DCMAKE_BUILD_TYPE=" + cfg,
             "-DPSP_CPP_BUILD=1",
             "-DPSP_WASM_BUILD=0",
             "-DPSP_PYTHON_BUILD=1",
             "-DPSP_PYTHON_VERSION={}".format(PYTHON_VERSION),
+            # read by `FindPythonHeaders` and the legacy `FindPythonInterp`/
+            # `FindPythonLibs` modules on every CMake version
             "-DPython_ADDITIONAL_VERSIONS={}".format(PYTHON_VERSION),
             "-DPython_FIND_VERSION={}".format(PYTHON_VERSION),
-            "-DPython_EXECUTABLE={}".format(sys.executable).replace("\\", "/"),
-            "-DPython_ROOT_DIR={}".format(sys.prefix).replace("\\", "/"),
-            "-DPython_ROOT={}".format(sys.prefix).replace("\\", "/"),
-            "-DPSP_CMAKE_MODULE_PATH={folder}".format(
-                folder=os.path.join(ext.sourcedir, "cmake")
-            ).replace("\\", "/"),
-            "-DPSP_CPP_SRC={folder}".format(folder=ext.sourcedir).replace("\\", "/"),
-            "-DPSP_PYTHON_SRC={folder}".format(
-                folder=os.path.join(ext.sourcedir, "..", "perspective").replace(
-                    "\\", "/"
-                )
-            ),
+            "-DPython_EXECUTABLE={}".format(exe),
+            "-DPython_ROOT_DIR={}".format(prefix),
+            "-DPSP_CMAKE_MODULE_PATH={}/cmake".format(src),
+            "-DPSP_CPP_SRC={}".format(src),
+            "-DPSP_PYTHON_SRC={}/../perspective".format(src),
+            # honor `CMAKE_INTERPROCEDURAL_OPTIMIZATION` despite the older
+            # `cmake_minimum_required` in the project
+            "-DCMAKE_POLICY_DEFAULT_CMP0069=NEW",
         ]
 
+        if self.cmake_version < (3, 16):
+            # Only a hint for older CMake, superseded by `Python_ROOT_DIR`
+            cmake_args += ["-DPython_ROOT={}".format(prefix)]
+
+        # Applied to the `psp` and `binding` targets only. Sources which don't
+        # compile when concatenated can be opted out with the
+        # `SKIP_UNITY_BUILD_INCLUSION` source file property. Always passed
+        # explicitly so that turning it off overrides the cached value.
+        unity = "ON" if os.environ.get("PSP_UNITY_BUILD", "1") == "1" else "OFF"
+        cmake_args += ["-DPSP_UNITY_BUILD={}".format(unity)]
+
+        # Always passed explicitly so that a cached `ON` is reset
+        lto = (
+            "ON" if cfg == "Release" and os.environ.get("PSP_LTO", "") == "1" else "OFF"
+        )
+        cmake_args += ["-DCMAKE_INTERPROCEDURAL_OPTIMIZATION={}".format(lto)]
+
+        if platform.system() == "Windows":
+            # multi-config generators read the per-config variable
+            cmake_args += [
+                "-DCMAKE_INTERPROCEDURAL_OPTIMIZATION_RELEASE={}".format(lto)
+            ]
+
         build_args = ["--config", cfg]
 
+        if "CMAKE_BUILD_PARALLEL_LEVEL" not in os.environ:
+            build_args += ["--parallel", str(get_num_jobs())]
+
+        cmake_args += ["-G", self.generator]
+
         if platform.system() == "Windows":
-            import distutils.msvccompiler as dm
-
-            msvc = {
-                "12": "Visual Studio 12 2013",
-                "14": "Visual Studio 14 2015",
-                "14.1": "Visual Studio 15 2017",
-            }.get(dm.get_build_version(), "Visual Studio 15 2017")
-
-            cmake_args.extend(
-                [
-                    "-DCMAKE_LIBRARY_OUTPUT_DIRECTORY_{}={}".format(
-                        cfg.upper(), extdir
-                    ).replace("\\", "/"),
-                    "-G",
-                    os.environ.get("PSP_GENERATOR", msvc),
-                ]
+            cmake_args.append(
+                "-DCMAKE_LIBRARY_OUTPUT_DIRECTORY_{}={}".format(
+                    cfg.upper(), extdir
+                ).replace("\\", "/")
             )
 
-            if sys.maxsize > 2 ** 32:
+            if self.generator.startswith("Visual Studio") and sys.maxsize > 2 ** 32:
                 # build 64 bit to match python
                 cmake_args += ["-A", "x64"]
 
-            build_args += [
-                "--",
-                "/m:{}".format(CPU_COUNT),
-                "/p:Configuration={}".format(cfg),
-            ]
-        else:
-            cmake_args += ["-DCMAKE_BUILD_TYPE=" + cfg]
-            build_args += [
-                "--",
-                "-j2" if os.environ.get("DOCKER", "") else "-j{}".format(CPU_COUNT),
-            ]
-
-        env = os.environ.copy()
-        env["PSP_ENABLE_PYTHON"] = "1"
-        env["OSX_DEPLOYMENT_TARGET"] = "10.9"
+        # Always set the launcher so a previously cached one is cleared
+        launcher = (self.compiler_launcher or "").replace("\\", "/")
+        cmake_args += [
+            "-DCMAKE_C_COMPILER_LAUNCHER={}".format(launcher),
+            "-DCMAKE_CXX_COMPILER_LAUNCHER={}".format(launcher),
+        ]
 
         if not os.path.exists(self.build_temp):
             os.makedirs(self.build_temp)
 
-        subprocess.check_call(
-            [self.cmake_cmd, os.path.abspath(ext.sourcedir)] + cmake_args,
-            cwd=self.build_temp,
-            env=env,
-            stderr=subprocess.STDOUT,
-        )
-        subprocess.check_call(
+        configure_cmd = [
+            self.cmake_cmd,
+            "--no-warn-unused-cli",
+            os.path.abspath(ext.sourcedir),
+        ] + cmake_args
+
+        # Skip re-configuring when the build directory was already configured
+        # with exactly the same arguments and environment.
+        configure_env = [
+            "{}={}".format(name, env[name]) if name in env else name
+            for name in _CONFIGURE_ENV
+        ]
+        cache_key = hashlib.blake2b(
+            "\0".join(configure_cmd + configure_env).encode()
+        ).hexdigest()
+        cache_key_path = os.path.join(self.build_temp, ".psp_cache_key")
+
+        # Written only once `cmake --build` succeeds for the current key, so an
+        # interrupted or failed build is never mistaken for an up to date one.
+        stamp_path = os.path.join(self.build_temp, ".psp_build_stamp")
+
+        configured = self.is_configured(cache_key, cache_key_path)
+
+        if (
+            configured
+            and not self.force
+            and _read_key(stamp_path) == cache_key
+            and self.is_up_to_date(ext, outdir)
+        ):
+            print("{} is up to date, skipping CMake build".format(ext.name))
+            return
+
+        if os.path.exists(stamp_path):
+            os.remove(stamp_path)
+
+        if not configured:
+            # Invalidate the key first, as a failed configure may still have
+            # rewritten `CMakeCache.txt` with the new arguments.
+            if os.path.exists(cache_key_path):
+                os.remove(cache_key_path)
+
+            subprocess.run(
+                configure_cmd,
+                check=True,
+                cwd=self.build_temp,
+                env=env,
+                stderr=subprocess.STDOUT,
+                close_fds=_CLOSE_FDS,
+            )
+
+            with open(cache_key_path, "w") as f:
+                f.write(cache_key)
+
+        subprocess.run(
             [self.cmake_cmd, "--build", "."] + build_args,
+            check=True,
             cwd=self.build_temp,
             env=env,
             stderr=subprocess.STDOUT,
+            close_fds=_CLOSE_FDS,
         )
+
+        with open(stamp_path, "w") as f:
+            f.write(cache_key)
+
         print()  # Add an empty line for cleaner output
 
+    def is_up_to_date(self, ext, outdir):
+        """Whether all of the libraries exist in `outdir` and are newer than
+        all of the C++ sources and CMake files they are built from.
+        """
+        try:
+            libraries = [
+                os.stat(os.path.join(outdir, lib)).st_mtime for lib in _LIBRARIES
+            ]
+        except OSError:
+            return False
+
+        python_src = os.path.join(ext.sourcedir, "..", "perspective")
+        sources = itertools.chain(
+            _walk_mtimes(ext.sourcedir, _SOURCE_SUFFIXES),
+            _walk_mtimes(os.path.join(python_src, "src"), _SOURCE_SUFFIXES),
+            _walk_mtimes(os.path.join(python_src, "include"), _SOURCE_SUFFIXES),
+        )
+
+        return max(sources, default=0) < min(libraries)
+
+    def cached_generator(self):
+        """The generator `build_temp` was configured with, if any."""
+        try:
+            with open(os.path.join(self.build_temp, "CMakeCache.txt")) as f:
+                for line in f:
+                    if line.startswith("CMAKE_GENERATOR:"):
+                        return line.split("=", 1)[1].strip()
+        except OSError:
+            pass
+
+        return None
+
+    def is_configured(self, cache_key, cache_key_path):
+        """Whether `build_temp` holds a CMake cache generated from the
+        configure arguments hashed into `cache_key`.
+        """
+        if not os.path.exists(os.path.join(self.build_temp, "CMakeCache.txt")):
+            return False
+
+        return _read_key(cache_key_path) == cache_key
+
 
 class PSPCheckSDist(sdist):
     def run(self):
         self.run_check()
-        super(PSPCheckSDist, self).run()
+        super().run()
 
     def run_check(self):
+        dist = os.path.join(here, "dist")
+        try:
+            found = set(os.listdir(dist))
+        except OSError:
+            found = set()
+
         for file in ("CMakeLists.txt", "cmake", "src"):
-            path = os.path.abspath(os.path.join(here, "dist", file))
-            if not os.path.exists(path):
+            if file not in found:
+                path = os.path.join(dist, file)
                 raise Exception(
                     "Path is missing! {}\nMust run `yarn build_python` before building sdist so cmake files are installed".format(
                         path
@@ -247,19 +516,18 @@ setup(
     license="Apache 2.0",
     classifiers=[
         "Development Status :: 3 - Alpha",
-        "Programming Language :: Python :: 2",
-        "Programming Language :: Python :: 2.7",
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3.6",
         "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
     ],
     keywords="analytics tools plotting",
-    packages=find_packages(exclude=["bench", "bench.*"]),
+    python_requires=">=3.6",
+    packages=packages,
     include_package_data=True,
     zip_safe=False,
-    install_requires=requires,
-    extras_require={"dev": requires_dev, "devpy2": requires_dev_py2},
+    install_requires=list(_CORE_REQUIRES),
+    extras_require={"dev": requires_dev},
     ext_modules=[PSPExtension("perspective")],
     cmdclass=dict(build_ext=PSPBuild, sdist=PSPCheckSDist),
 )
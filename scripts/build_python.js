@@ -10,19 +10,18 @@
 const {execute, execute_throw, docker, resolve, getarg, bash, python_image} = require("./script_utils.js");
 const fs = require("fs-extra");
 
-const IS_PY2 = getarg("--python2");
+if (getarg("--python2")) {
+    console.error("Python 2 is no longer supported by `perspective-python`");
+    process.exit(1);
+}
 
-let PYTHON = IS_PY2 ? "python2" : getarg("--python38") ? "python3.8" : getarg("--python36") ? "python3.6" : "python3.7";
+let PYTHON = getarg("--python38") ? "python3.8" : getarg("--python36") ? "python3.6" : "python3.7";
 let IMAGE = "manylinux2010";
 const IS_DOCKER = process.env.PSP_DOCKER;
 
 if (IS_DOCKER) {
     // defaults to 2010
-    let MANYLINUX_VERSION = "manylinux2010";
-    if (!IS_PY2) {
-        // switch to 2014 only on python3
-        (MANYLINUX_VERSION = getarg("--manylinux2010") ? "manylinux2010" : getarg("--manylinux2014") ? "manylinux2014" : "manylinux2010"), PYTHON;
-    }
+    const MANYLINUX_VERSION = getarg("--manylinux2010") ? "manylinux2010" : getarg("--manylinux2014") ? "manylinux2014" : "manylinux2010";
     IMAGE = python_image(MANYLINUX_VERSION, PYTHON);
 }
 
@@ -60,12 +59,7 @@ try {
 
     let cmd;
     if (IS_CI) {
-        if (IS_PY2) {
-            // shutil_which is required in setup.py
-            cmd = bash`${PYTHON} -m pip install backports.shutil_which && ${PYTHON} -m pip install -e .[devpy2] --no-clean &&`;
-        } else {
-            cmd = bash`${PYTHON} -m pip install -e .[dev] --no-clean &&`;
-        }
+        cmd = bash`${PYTHON} -m pip install -e .[dev] --no-clean &&`;
 
         // pip install in-place with --no-clean so that pep-518 assets stick
         // around for later wheel build (so cmake cache can stay in place)
@@ -9,18 +9,19 @@
 const {execute, docker, resolve, getarg, python_image} = require("./script_utils.js");
 
 const IS_DOCKER = process.env.PSP_DOCKER;
-const IS_PY2 = getarg("--python2");
-const PYTHON = IS_PY2 ? "python2" : getarg("--python38") ? "python3.8" : getarg("--python36") ? "python3.6" : "python3.7";
+
+if (getarg("--python2")) {
+    console.error("Python 2 is no longer supported by `perspective-python`");
+    process.exit(1);
+}
+
+const PYTHON = getarg("--python38") ? "python3.8" : getarg("--python36") ? "python3.6" : "python3.7";
 
 let IMAGE = "manylinux2014";
 
 if (IS_DOCKER) {
-    // defaults to 2010
-    let MANYLINUX_VERSION = "manylinux2010";
-    if (!IS_PY2) {
-        // switch to 2014 only on python3
-        MANYLINUX_VERSION = getarg("--manylinux2010") ? "manylinux2010" : getarg("--manylinux2014") ? "manylinux2014" : "manylinux2014";
-    }
+    // defaults to 2014
+    const MANYLINUX_VERSION = getarg("--manylinux2010") ? "manylinux2010" : getarg("--manylinux2014") ? "manylinux2014" : "manylinux2014";
     IMAGE = python_image(MANYLINUX_VERSION, PYTHON);
 }
 
@@ -289,13 +289,6 @@ exports.docker = function docker(image = "puppeteer") {
  */
 exports.python_image = function python_image(image = "", python = "") {
     console.log(`-- Getting image for image: '${image}' and python: '${python}'`);
-    if (python == "python2") {
-        if (image == "manylinux2014") {
-            throw "Python2 not supported for manylinux2014";
-        } else {
-            return "manylinux2010";
-        }
-    }
     return `${image}`;
 };
 
@@ -8,7 +8,12 @@
  */
 const {bash, execute, execute_throw, docker, resolve, getarg, python_image} = require("./script_utils.js");
 
-let PYTHON = getarg("--python2") ? "python2" : getarg("--python38") ? "python3.8" : "python3.7";
+if (getarg("--python2")) {
+    console.error("Python 2 is no longer supported by `perspective-python`");
+    process.exit(1);
+}
+
+let PYTHON = getarg("--python38") ? "python3.8" : "python3.7";
 
 const COVERAGE = getarg("--coverage");
 const VERBOSE = getarg("--debug");